@@ -9,18 +9,28 @@ Usage examples:
 """
 
 import argparse
+import atexit
 import os
 import sys
+import itertools
 import json
 import time
 import uuid
-import random
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
-import requests
+import httpx
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+import simdjson
+import xxhash
+import zstandard as zstd
 from dotenv import load_dotenv
+from numba import njit
 from zoneinfo import ZoneInfo
 from tqdm import tqdm
 
@@ -37,11 +47,33 @@ DEFAULT_USER_FIELDS = (
 )
 EXPANSIONS = "author_id"
 
+# Columnar sink for downstream analysis: dictionary-encoded low-cardinality
+# columns, narrow ints for the derived features.
+PARQUET_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("author_id", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("text", pa.string()),
+        ("lang", pa.dictionary(pa.int32(), pa.string())),
+        ("hour_local", pa.int8()),
+        ("weekday", pa.int8()),
+        ("upper_ratio", pa.float32()),
+        ("contains_question", pa.bool_()),
+    ]
+)
+
 # ------------------------------- HELPERS -------------------------------- #
 
 
+# Pregenerated multipliers in [1.0, 1.1): the retry path indexes an array
+# instead of dispatching through random.Random per call.
+_JITTERS = 1.0 + np.random.default_rng(0).random(16) * 0.1
+_jitter_idx = itertools.count()
+
+
 def jitter(seconds: float = 1.0) -> float:
-    return seconds * (1 + random.random() * 0.1)
+    return seconds * float(_JITTERS[next(_jitter_idx) & 15])
 
 
 def b64mask(token: str, keep: int = 4) -> str:
@@ -80,6 +112,41 @@ class State:
         self.path.write_text(json.dumps(self._data, indent=2))
 
 
+class BloomFilter:
+    """Compact persistent membership filter for already-written tweet ids.
+
+    k seeded xxh3 hashes over a fixed numpy bit array. A false positive
+    permanently drops a liked tweet from every sink, so the default is
+    sized for that risk: 8 MiB keeps the false-positive rate around
+    2e-6 even at 300k likes (it would be ~1e-3 at 1 MiB).
+    """
+
+    K = 3
+
+    def __init__(self, path: Path, num_bits: int = 1 << 26):
+        self.path = path
+        self.num_bits = num_bits
+        if path.exists() and path.stat().st_size == num_bits // 8:
+            self.bits = np.fromfile(path, dtype=np.uint8)
+        else:
+            self.bits = np.zeros(num_bits // 8, dtype=np.uint8)
+
+    def contains(self, key: bytes) -> bool:
+        for seed in range(self.K):
+            pos = xxhash.xxh3_64_intdigest(key, seed=seed) % self.num_bits
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, key: bytes):
+        for seed in range(self.K):
+            pos = xxhash.xxh3_64_intdigest(key, seed=seed) % self.num_bits
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def save(self):
+        self.bits.tofile(self.path)
+
+
 # ------------------------------- TOKEN ---------------------------------- #
 
 
@@ -109,7 +176,7 @@ def refresh_tokens(tokens_path: Path, client_id: str, client_secret: Optional[st
 
         basic = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
         headers["Authorization"] = f"Basic {basic}"
-    resp = requests.post(token_url, data=payload, headers=headers, timeout=30)
+    resp = httpx.post(token_url, data=payload, headers=headers, timeout=30)
     if resp.status_code != 200:
         raise RuntimeError(f"Token refresh failed: {resp.text}")
     new_tokens = resp.json()
@@ -122,19 +189,70 @@ def refresh_tokens(tokens_path: Path, client_id: str, client_secret: Optional[st
 # ------------------------------- DERIVED FEATURES ----------------------- #
 
 
+@njit(cache=True)
+def _scan_text(arr):
+    """Single native loop over ASCII bytes: (alpha, upper, has_question)."""
+    alpha = 0
+    upper = 0
+    has_question = False
+    for b in arr:
+        if 65 <= b <= 90:
+            upper += 1
+            alpha += 1
+        elif 97 <= b <= 122:
+            alpha += 1
+        elif b == 63:  # "?"
+            has_question = True
+    return alpha, upper, has_question
+
+
 def derive_flags(text: str) -> Dict[str, Any]:
-    alpha = sum(1 for c in text if c.isalpha())
-    upper = sum(1 for c in text if c.isupper())
+    if not text or text.isspace():
+        # Nothing to scan and "?" cannot appear.
+        return {"contains_question": False, "upper_ratio": 0.0}
+    if text.isascii():
+        alpha, upper, has_question = _scan_text(
+            np.frombuffer(text.encode(), dtype=np.uint8)
+        )
+        contains_question = bool(has_question)
+    else:
+        # Non-ASCII text needs full unicode categorization.
+        alpha = sum(1 for c in text if c.isalpha())
+        upper = sum(1 for c in text if c.isupper())
+        contains_question = "?" in text
     upper_ratio = upper / alpha if alpha else 0.0
     return {
-        "contains_question": "?" in text,
+        "contains_question": contains_question,
         "upper_ratio": round(upper_ratio, 3),
     }
 
 
+@lru_cache(maxsize=1024)
+def _offset_for_hour(tz: ZoneInfo, y: int, m: int, d: int, h: int) -> int:
+    """UTC offset (seconds) for the given UTC hour.
+
+    Keyed per hour rather than per day so DST transition days resolve
+    correctly; a run's tweets span few distinct hours, so hits dominate.
+    """
+    dt = datetime(y, m, d, h, tzinfo=timezone.utc).astimezone(tz)
+    return int(dt.utcoffset().total_seconds())
+
+
 def local_temporal(utc_iso: str, tz: ZoneInfo) -> Dict[str, int]:
-    dt_utc = datetime.fromisoformat(utc_iso.replace("Z", "+00:00")).astimezone(tz)
-    return {"hour_local": dt_utc.hour, "weekday": dt_utc.weekday()}
+    # X timestamps are always "YYYY-MM-DDTHH:MM:SS.000Z"; slicing the
+    # fixed-width fields skips fromisoformat and the replace() copy, and
+    # the per-hour offset cache skips the ZoneInfo lookup per tweet.
+    y, m, d = int(utc_iso[0:4]), int(utc_iso[5:7]), int(utc_iso[8:10])
+    h = int(utc_iso[11:13])
+    secs = (
+        h * 3600
+        + int(utc_iso[14:16]) * 60
+        + int(utc_iso[17:19])
+        + _offset_for_hour(tz, y, m, d, h)
+    )
+    days, rem = divmod(secs, 86400)
+    ordinal = date(y, m, d).toordinal() + days
+    return {"hour_local": rem // 3600, "weekday": (ordinal - 1) % 7}
 
 
 # ------------------------------- CORE ----------------------------------- #
@@ -152,6 +270,7 @@ class LikesScraper:
         since: bool,
     ):
         self.token = access_token
+        self._hdr = {"Authorization": f"Bearer {access_token}"}
         self.out = output_dir
         self.state = state
         self.tz = tz
@@ -162,36 +281,126 @@ class LikesScraper:
         ensure_dir(self.out / "raw")
         ensure_dir(self.out / "data")
 
-        # File handles
-        self.tweets_fp = open(self.out / "data" / "tweets.jsonl", "a", encoding="utf-8")
-        self.users_fp = open(self.out / "data" / "users.jsonl", "a", encoding="utf-8")
+        # Raw fds: each page's records leave in one writev scatter-gather
+        # call, so no userspace buffer or per-page flush is needed.
+        open_flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        self.tweets_fd = os.open(self.out / "data" / "tweets.jsonl", open_flags, 0o644)
+        self.users_fd = os.open(self.out / "data" / "users.jsonl", open_flags, 0o644)
 
+        # 64-bit xxh3 digests of ids: ints hash/compare faster than the
+        # full id strings and hold memory flat on long backfills.
         self.seen_tweet_ids = set()
         self.seen_user_ids = set()
+        # Survives across runs, so a --since run after lost state does
+        # not re-append tweets already in tweets.jsonl.
+        self.seen_bloom = BloomFilter(self.out / "data" / "seen.bloom")
+
+        # State is saved once at run end; atexit covers early exits
+        # (Ctrl+C, unhandled errors) without rewriting the whole blob on
+        # every page.
+        atexit.register(self.state.save)
+
+        # One HTTP/2 client for the whole run: pagination rides a single
+        # multiplexed connection with HPACK-compressed headers instead of
+        # a fresh handshake and full header block per page.
+        self.client = httpx.Client(
+            http2=True,
+            timeout=30,
+            limits=httpx.Limits(max_connections=4),
+        )
+
+        # Reused across pages to amortize buffer allocation. The parser
+        # refuses to re-parse while Object/Array proxies into the old
+        # buffer are still alive, so the fetch loop drops each page's
+        # proxies before the next parse().
+        self._json_parser = simdjson.Parser()
+
+        # Raw page dumps compress ~5x at level 3, faster than the disk
+        # write they replace.
+        self._zstd = zstd.ZstdCompressor(level=3, threads=-1)
+
+        # Parquet is append-hostile, so each run gets its own file,
+        # created lazily on the first non-empty page.
+        self._parquet_writer = None
+        self._parquet_path = (
+            self.out
+            / "data"
+            / f"tweets_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.parquet"
+        )
+
+        # Pay the one-time JIT compilation cost before the fetch loop.
+        derive_flags("warmup?")
 
     # -------------- Networking helpers ----------------#
 
-    def _headers(self):
-        return {"Authorization": f"Bearer {self.token}"}
+    def set_token(self, access_token: str):
+        self.token = access_token
+        self._hdr = {"Authorization": f"Bearer {access_token}"}
 
     def _get(self, url: str, params: Dict[str, Any]):
-        resp = requests.get(url, headers=self._headers(), params=params, timeout=30)
-        if resp.status_code == 401:
-            raise RuntimeError("401 Unauthorized – access token expired.")
-        if resp.status_code == 429:
-            reset = int(resp.headers.get("x-rate-limit-reset", time.time() + 60))
-            sleep_for = max(reset - int(time.time()), 0) + 5
-            print(f"429 Rate limit. Sleeping {sleep_for}s …")
-            time.sleep(sleep_for)
-            return self._get(url, params)
-        resp.raise_for_status()
-        return resp
+        for _ in range(5):
+            resp = self.client.get(url, headers=self._hdr, params=params)
+            if resp.status_code == 401:
+                raise RuntimeError("401 Unauthorized – access token expired.")
+            if resp.status_code == 429:
+                reset = int(resp.headers.get("x-rate-limit-reset", time.time() + 60))
+                sleep_for = max(reset - int(time.time()), 0) + jitter(5)
+                print(f"429 Rate limit. Sleeping {sleep_for:.1f}s …")
+                time.sleep(sleep_for)
+                continue
+            resp.raise_for_status()
+            return resp
+        raise RuntimeError(f"Still rate-limited after 5 attempts: {url}")
 
     # -------------- Storage helpers -------------------#
 
-    def _write_jsonl(self, fp, obj):
-        fp.write(json.dumps(obj, ensure_ascii=False) + "\n")
-        fp.flush()
+    def _writev(self, fd: int, lines: List[bytes]):
+        if not lines:
+            return
+        if hasattr(os, "writev"):
+            # Pages hold at most 100 records, well under IOV_MAX.
+            os.writev(fd, lines)
+        else:  # Windows has no writev
+            os.write(fd, b"".join(lines))
+
+    def _write_parquet(self, tweets: List[Dict[str, Any]]):
+        if not tweets:
+            return
+        batch = pa.record_batch(
+            [
+                pa.array([t["id"] for t in tweets], pa.string()),
+                pa.array([t["author_id"] for t in tweets], pa.string()),
+                pa.array(
+                    [t["created_at"] for t in tweets], pa.string()
+                ).cast(pa.timestamp("us", tz="UTC")),
+                pa.array([t["text"] for t in tweets], pa.string()),
+                pa.array(
+                    [t.get("lang") for t in tweets], pa.string()
+                ).dictionary_encode(),
+                pa.array(
+                    [t["temporal"]["hour_local"] for t in tweets], pa.int8()
+                ),
+                pa.array(
+                    [t["temporal"]["weekday"] for t in tweets], pa.int8()
+                ),
+                pa.array(
+                    [t["flags"]["upper_ratio"] for t in tweets], pa.float32()
+                ),
+                pa.array(
+                    [t["flags"]["contains_question"] for t in tweets],
+                    pa.bool_(),
+                ),
+            ],
+            schema=PARQUET_SCHEMA,
+        )
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(
+                self._parquet_path,
+                PARQUET_SCHEMA,
+                compression="snappy",
+                use_dictionary=True,
+            )
+        self._parquet_writer.write_batch(batch)
 
     # -------------- Main fetch loop -------------------#
 
@@ -199,12 +408,11 @@ class LikesScraper:
         user_id = self.state.get("user_id")
         if not user_id:
             # Attempt to fetch /users/me
-            me = requests.get(
-                f"{API_BASE}/users/me", headers=self._headers(), timeout=30
+            me = self.client.get(
+                f"{API_BASE}/users/me", headers=self._hdr
             ).json()
             user_id = me["data"]["id"]
             self.state.set("user_id", user_id)
-            self.state.save()
         print(f"Scraping likes for user_id={user_id}")
 
         params = {
@@ -231,59 +439,102 @@ class LikesScraper:
 
             url = f"{API_BASE}{LIKES_ENDPOINT.format(user_id=user_id)}"
             resp = self._get(url, params)
-            data = resp.json()
+            doc = self._json_parser.parse(resp.content)
             raw_path = (
                 self.out
                 / "raw"
-                / f"page_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{page:04d}.json"
+                / f"page_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{page:04d}.json.zst"
             )
-            raw_path.write_text(resp.text)
-
-            includes_users = {
-                u["id"]: u for u in data.get("includes", {}).get("users", [])
-            }
-
-            for tweet in data.get("data", []):
-                tid = tweet["id"]
-                if tid in self.seen_tweet_ids:
+            raw_path.write_bytes(self._zstd.compress(resp.content))
+
+            try:
+                includes_users = {
+                    u["id"]: u.as_dict() for u in doc["includes"]["users"]
+                }
+            except KeyError:
+                includes_users = {}
+
+            try:
+                page_tweets = doc["data"]
+            except KeyError:
+                page_tweets = []
+
+            # Pass 1: collect the page's new tweets/users without writing.
+            page_ids: List[str] = []
+            new_tweets: List[Dict[str, Any]] = []
+            new_users: List[Dict[str, Any]] = []
+            for item in page_tweets:
+                tid = item["id"]
+                page_ids.append(tid)
+                tid_b = tid.encode()
+                th = xxhash.xxh3_64_intdigest(tid_b)
+                if th in self.seen_tweet_ids or self.seen_bloom.contains(tid_b):
                     continue
-                # Derived flags
-                flags = derive_flags(tweet["text"])
-                temporal = local_temporal(tweet["created_at"], self.tz)
-                tweet["flags"] = flags
-                tweet["temporal"] = temporal
+                # Materialize only tweets we actually keep
+                tweet = item.as_dict()
                 tweet["source_page"] = raw_path.name
-                self._write_jsonl(self.tweets_fp, tweet)
-                self.seen_tweet_ids.add(tid)
-                # User
+                new_tweets.append(tweet)
+                self.seen_tweet_ids.add(th)
+                self.seen_bloom.add(tid_b)
                 uid = tweet["author_id"]
-                if uid in includes_users and uid not in self.seen_user_ids:
-                    self._write_jsonl(self.users_fp, includes_users[uid])
-                    self.seen_user_ids.add(uid)
-
-            meta = data.get("meta", {})
-            next_token = meta.get("next_token")
+                uh = xxhash.xxh3_64_intdigest(uid.encode())
+                if uid in includes_users and uh not in self.seen_user_ids:
+                    new_users.append(includes_users[uid])
+                    self.seen_user_ids.add(uh)
+
+            # Pass 2: derived features in bulk, then one writev syscall
+            # per file — records are durable at the page boundary with no
+            # separate flush.
+            for tweet in new_tweets:
+                tweet["flags"] = derive_flags(tweet["text"])
+                tweet["temporal"] = local_temporal(tweet["created_at"], self.tz)
+            self._writev(self.tweets_fd, [orjson.dumps(t) + b"\n" for t in new_tweets])
+            self._writev(self.users_fd, [orjson.dumps(u) + b"\n" for u in new_users])
+            self._write_parquet(new_tweets)
+
+            try:
+                next_token = doc["meta"]["next_token"]
+            except KeyError:
+                next_token = None
+
+            # Release this page's proxies (doc, the data Array, and the
+            # last loop item) so the parser can re-use its buffer on the
+            # next parse().
+            doc = page_tweets = item = None
 
             # Update cursors
-            if page == 0 and "data" in data and data["data"]:
-                self.state.set("newest_like_id", data["data"][0]["id"])
-            if not meta.get("next_token"):
+            if page == 0 and page_ids:
+                self.state.set("newest_like_id", page_ids[0])
+                # Durable sidecar: the one cursor worth an immediate
+                # write, without rewriting all of state.json.
+                (self.out / "data" / "cursor.txt").write_text(page_ids[0])
+            if not next_token and page_ids:
                 # Last page sets oldest
-                last_items = data.get("data", [])
-                if last_items:
-                    self.state.set("oldest_like_id", last_items[-1]["id"])
+                self.state.set("oldest_like_id", page_ids[-1])
 
             page += 1
             pbar.update(1)
             if not next_token:
                 break
+            # Preemptively wait out the window when the quota is nearly
+            # spent, instead of burning a round-trip on a guaranteed 429.
+            remaining = int(resp.headers.get("x-rate-limit-remaining", 99))
+            if remaining < 2:
+                reset = int(resp.headers.get("x-rate-limit-reset", time.time() + 60))
+                sleep_for = max(reset - int(time.time()), 0) + jitter(1)
+                print(f"Rate limit nearly spent. Sleeping {sleep_for:.1f}s …")
+                time.sleep(sleep_for)
 
         pbar.close()
         self.state.set("last_run_at", now_iso())
         self.state.set("pages_fetched", self.state.get("pages_fetched", 0) + page)
         self.state.save()
-        self.tweets_fp.close()
-        self.users_fp.close()
+        self.seen_bloom.save()
+        os.close(self.tweets_fd)
+        os.close(self.users_fd)
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        self.client.close()
         print(f"Finished. Pages fetched this run: {page}")
 
 # ------------------------------- CLI ------------------------------------#
@@ -333,7 +584,7 @@ def main():
             client_secret = os.getenv("X_CLIENT_SECRET")
             print("Attempting token refresh …")
             tokens = refresh_tokens(tokens_path, client_id, client_secret)
-            scraper.token = tokens["access_token"]
+            scraper.set_token(tokens["access_token"])
             scraper.run()
         else:
             raise
@@ -30,7 +30,6 @@ import time
 import base64
 import hashlib
 import secrets
-import threading
 import urllib.parse
 import webbrowser
 from http.server import BaseHTTPRequestHandler, HTTPServer
@@ -57,10 +56,11 @@ def b64url(data: bytes) -> str:
     return base64.urlsafe_b64encode(data).decode().rstrip("=")
 
 def gen_code_verifier_challenge() -> tuple[str, str]:
-    code_verifier = b64url(secrets.token_bytes(32))
-    challenge = hashlib.sha256(code_verifier.encode()).digest()
-    code_challenge = b64url(challenge)
-    return code_verifier, code_challenge
+    # The verifier is base64url output, so pure ASCII: an explicit ascii
+    # encode skips the UTF-8 validation pass before hashing.
+    verifier_b = b64url(secrets.token_bytes(32)).encode("ascii")
+    challenge = hashlib.sha256(verifier_b).digest()
+    return verifier_b.decode("ascii"), b64url(challenge)
 
 def load_config():
     load_dotenv(dotenv_path=ROOT / ".env")
@@ -118,9 +118,6 @@ def start_local_server(redirect_uri: str, expected_state: str):
     server.callback_path = callback_path
     server.auth_code = None
     server.error = None
-
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
     return server
 
 class OAuthHTTPServer(HTTPServer):
@@ -217,19 +214,23 @@ def main():
     print(auth_url)
     webbrowser.open(auth_url)
 
-    # Wait for callback
+    # Block on the callback directly — no worker thread, no polling.
+    # Stray requests (e.g. favicon) get a 404 and we keep waiting.
     print("Waiting for authorization… (Ctrl+C to abort)")
-    for _ in range(600):  # 10 minutes
-        if getattr(server, "auth_code", None) or getattr(server, "error", None):
+    deadline = time.time() + 600  # 10 minutes
+    while server.auth_code is None and server.error is None:
+        remaining = deadline - time.time()
+        if remaining <= 0:
             break
-        time.sleep(1)
+        server.timeout = remaining
+        server.handle_request()
 
     if server.error or not server.auth_code:
         print("Authorization failed or timed out.")
         sys.exit(1)
 
     code = server.auth_code
-    server.shutdown()
+    server.server_close()
 
     print("Exchanging code for tokens…")
     tokens = exchange_code_for_tokens(code, client_id, redirect_uri, code_verifier)